@@ -9,10 +9,10 @@ import sys
 import subprocess
 import time
 
-from collections import namedtuple
+from collections import defaultdict, namedtuple
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Iterable, List
+from typing import Any, Dict, Iterable, List, Set
 
 import boto3
 import botocore
@@ -20,6 +20,14 @@ import click
 
 
 IMAGE_REGEX = r"([\w.-]+)_(\d{8}.\d{6}).(.*)"
+VERSION_DATE_FORMAT = "%Y%m%d.%H%M%S"
+
+# Maximum number of image ids accepted by ECR batch_get_image and batch_delete_image calls
+ECR_BATCH_SIZE = 100
+ECR_INDEX_MEDIA_TYPES = [
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+]
 
 
 @dataclass
@@ -144,37 +152,107 @@ def parse_image_name(image_path: str) -> ImageEntry:
     return ImageEntry(*match.groups())
 
 
-def list_s3_images(client, bucket, prefix) -> List[ImageEntry]:
-    """List S3 images."""
-    files = []
+def list_s3_image_sizes(client, bucket, prefix) -> Dict[ImageEntry, int]:
+    """List S3 images along with their size in bytes, skipping keys that are not images."""
+    sizes = {}
+
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if re.search(IMAGE_REGEX, obj["Key"]):
+                sizes[parse_image_name(obj["Key"])] = obj["Size"]
+
+    return sizes
+
 
-    objects = client.list_objects_v2(Bucket=bucket, Prefix=prefix)
-    if "Contents" in objects:
-        for obj in objects["Contents"]:
-            files.append(parse_image_name(obj["Key"]))
+def list_s3_release_labels(client, bucket) -> List[str]:
+    """List release labels, i.e. top level prefixes, in an S3 bucket."""
+    release_labels = []
 
-    return files
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Delimiter="/"):
+        for common_prefix in page.get("CommonPrefixes", []):
+            release_labels.append(common_prefix["Prefix"].rstrip("/"))
 
+    return release_labels
 
-def delete_s3_images(images: Iterable[ImageEntry], bucket: str, prefix: str):
+
+def delete_s3_image(client, bucket: str, key: str):
     """
-    Delete files from s3, including all versions if versioning is enabled.
+    Delete a file from s3, including all versions if versioning is enabled.
     """
-    s3_resource = boto3.resource("s3")
-    bucket = s3_resource.Bucket(bucket)
+    click.echo(f"Deleting {key}")
+
+    # Delete all versions if versioning is enabled
+    paginator = client.get_paginator("list_object_versions")
+    for page in paginator.paginate(Bucket=bucket, Prefix=key):
+        for version in page.get("Versions", []) + page.get("DeleteMarkers", []):
+            client.delete_object(Bucket=bucket, Key=version["Key"], VersionId=version["VersionId"])
 
-    for image in images:
-        key = f"{prefix}/{image}"
+    # Also delete the current object (in case versioning is not enabled)
+    client.delete_object(Bucket=bucket, Key=key)
 
-        click.echo(f"Deleting {image}")
 
-        # Delete all versions if versioning is enabled
-        object_versions = bucket.object_versions.filter(Prefix=key)
-        for version in object_versions:
-            version.delete()
+def list_ecr_images(client, repository: str) -> Dict[ImageEntry, List[Dict[str, Any]]]:
+    """
+    List untagged docker images in ECR, mapped to their image details.
 
-        # Also delete the current object (in case versioning is not enabled)
-        bucket.Object(key).delete()
+    Pushing a tag moves it to the new image and leaves the previous one untagged, so these are the images
+    superseded by newer builds. Images referenced by a tagged manifest list are not listed.
+    """
+    untagged_images = []
+    index_ids = []
+
+    paginator = client.get_paginator("describe_images")
+    for page in paginator.paginate(repositoryName=repository):
+        for image in page["imageDetails"]:
+            if not image.get("imageTags"):
+                untagged_images.append(image)
+            elif image.get("imageManifestMediaType") in ECR_INDEX_MEDIA_TYPES:
+                index_ids.append({"imageDigest": image["imageDigest"]})
+
+    live_digests: Set[str] = set()
+    for i in range(0, len(index_ids), ECR_BATCH_SIZE):
+        response = client.batch_get_image(
+            repositoryName=repository,
+            imageIds=index_ids[i:i + ECR_BATCH_SIZE],
+            acceptedMediaTypes=ECR_INDEX_MEDIA_TYPES,
+        )
+        for index in response["images"]:
+            manifest = json.loads(index["imageManifest"])
+            live_digests.update(entry["digest"] for entry in manifest.get("manifests", []))
+
+    images: Dict[ImageEntry, List[Dict[str, Any]]] = defaultdict(list)
+    for image in untagged_images:
+        if image["imageDigest"] not in live_digests:
+            version = image["imagePushedAt"].strftime(VERSION_DATE_FORMAT)
+            images[ImageEntry(repository, version, "docker")].append(image)
+
+    return dict(images)
+
+
+def delete_ecr_images(client, digests: Iterable[str], repository: str) -> List[str]:
+    """
+    Delete docker images from ECR by digest.
+    :return: digests of the deleted images
+    """
+    image_ids = [{"imageDigest": digest} for digest in digests]
+    deleted: List[str] = []
+
+    for i in range(0, len(image_ids), ECR_BATCH_SIZE):
+        chunk = image_ids[i:i + ECR_BATCH_SIZE]
+        for image_id in chunk:
+            click.echo(f"Deleting {repository}@{image_id['imageDigest']}")
+
+        response = client.batch_delete_image(repositoryName=repository, imageIds=chunk)
+        for failure in response.get("failures", []):
+            click.echo(
+                f"Unable to delete {repository}@{failure['imageId'].get('imageDigest')}: {failure['failureReason']}",
+                err=True,
+            )
+        deleted.extend(image_id["imageDigest"] for image_id in response.get("imageIds", []))
+
+    return deleted
 
 
 def lock_index_file(client, bucket, index_key):
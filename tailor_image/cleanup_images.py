@@ -2,18 +2,27 @@
 import argparse
 import bisect
 import sys
+import time
 
 from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Any, Iterable, Dict, Set, Optional, Tuple
+from fnmatch import fnmatch
+from typing import Any, Iterable, Dict, List, Set, Optional, Tuple
 
 import boto3
 import click
 
 from . import (
+    ECR_BATCH_SIZE,
+    VERSION_DATE_FORMAT,
     ImageEntry,
-    list_s3_images,
-    delete_s3_images,
+    list_ecr_images,
+    list_s3_image_sizes,
+    list_s3_release_labels,
+    delete_ecr_images,
+    delete_s3_image,
     read_index_file,
     unlock_index_file,
     wait_for_index,
@@ -21,10 +30,26 @@ from . import (
 )
 
 
-VERSION_DATE_FORMAT = "%Y%m%d.%H%M%S"
+MAX_CLEANUP_WORKERS = 16
 
 
-def build_deletion_list(images: Iterable[ImageEntry], num_to_keep: int = None, date_to_keep: datetime = None):
+@dataclass
+class CleanupSummary:
+    """Objects and bytes freed while cleaning up a release label or docker repository."""
+    name: str
+    started_at: float
+    finished_at: float
+    objects: int = 0
+    size: int = 0
+
+    @property
+    def seconds(self) -> float:
+        return self.finished_at - self.started_at
+
+
+def build_deletion_list(
+    images: Iterable[ImageEntry], num_to_keep: Optional[int] = None, date_to_keep: Optional[datetime] = None
+):
     """Filter a debian package list down to packages to be deleted given some rules.
     :param packages: packages to filter
     :param num_to_keep: number of packages of the same to keep
@@ -73,75 +98,264 @@ def cleanup_index(image_index, keep_images) -> Dict[Any, Any]:
     return image_index
 
 
-def cleanup_images(
-    organization: str,
-    release_label: str,
-    apt_repo: str,
-    days_to_keep: int = None,
-    num_to_keep: int = None,
-    dry_run: bool = False,
-) -> None:
-    """Cleanup images according to a cleanup policy (days/number of packages to keep).
-    :param organization: Name of the organization
-    :param release_label: Release label of apt repo to target.
-    :param apt_repo: S3 bucket where to publish release label.
-    :param days_to_keep: (Optional) Age in days at which old images should be cleaned up.
-    :param num_to_keep: (Optional) Quantity of old images to keep.
-    """
-    s3_client = boto3.client("s3")
-    prefix = f"{release_label}/images"
-
-    if days_to_keep is not None:
-        date_to_keep: Optional[datetime] = datetime.now() - timedelta(days=days_to_keep)
-    else:
-        date_to_keep = None
-
-    remote_images = list_s3_images(s3_client, apt_repo, prefix + f"/{organization}")
-    to_delete = build_deletion_list(remote_images, num_to_keep, date_to_keep)
-    if not dry_run:
-        delete_s3_images(to_delete, apt_repo, prefix)
-    else:
-        click.echo("[DRY RUN] Would delete images from repo:")
-        for image in to_delete:
-            click.echo(image)
-
-    # Calculate the list of images to keep
-    keep_images = set(remote_images) - to_delete
-
+def update_index(client, apt_repo: str, release_label: str, keep_images: Set[ImageEntry], dry_run: bool = False):
+    """Remove image versions that are no longer kept from the index of a release label."""
     # Get index file with image versions
     index_key = release_label + "/images/index"
 
     # Wait until index file is unlocked and lock it while we update it
-    wait_for_index(s3_client, apt_repo, index_key)
+    wait_for_index(client, apt_repo, index_key)
 
     try:
-        image_index = read_index_file(s3_client, apt_repo, index_key)
+        image_index = read_index_file(client, apt_repo, index_key)
         image_index = cleanup_index(image_index, keep_images)
 
         if not dry_run:
-            click.echo("Updating index file")
-            write_index_file(image_index, s3_client, apt_repo, index_key)
+            click.echo(f"Updating index file {index_key}")
+            write_index_file(image_index, client, apt_repo, index_key)
         else:
-            click.echo("[DRY RUN] New version in index file:")
+            click.echo(f"[DRY RUN] New version in index file {index_key}:")
             for version in image_index.keys():
                 click.echo(version)
 
     finally:
-        unlock_index_file(s3_client, apt_repo, index_key)
+        unlock_index_file(client, apt_repo, index_key)
+
+
+def plan_ecr_cleanup(
+    images: Dict[ImageEntry, List[Dict[str, Any]]],
+    repository: str,
+    date_to_keep: Optional[datetime] = None,
+    dry_run: bool = False,
+) -> List[Dict[str, Any]]:
+    """Filter ECR images down to the image details of those pushed before date_to_keep.
+    Untagged images of the whole repository form a single group, so a number of images to keep is not applied.
+    """
+    to_delete = build_deletion_list(images, date_to_keep=date_to_keep)
+    to_delete_images = [image for entry in sorted(to_delete, key=str) for image in images[entry]]
+
+    if dry_run:
+        click.echo(f"[DRY RUN] Would delete images from {repository}:")
+        for image in to_delete_images:
+            click.echo(f"{repository}@{image['imageDigest']}")
+
+    return to_delete_images
+
+
+def is_pattern(value: str) -> bool:
+    """Whether a release label or organization is a glob pattern."""
+    return any(char in value for char in "*?[")
+
+
+def format_size(size: float) -> str:
+    """Format a size in bytes in human readable form."""
+    if size < 1024:
+        return f"{size:.0f} B"
+    size /= 1024
+    for unit in ["KiB", "MiB", "GiB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+def _timed(func, *args, **kwargs) -> Tuple[Any, float, float]:
+    """Run a function and return its result along with the times at which it started and finished."""
+    started_at = time.monotonic()
+    result = func(*args, **kwargs)
+    return result, started_at, time.monotonic()
+
+
+def cleanup_releases(
+    organizations: List[str],
+    release_labels: List[str],
+    apt_repo: str,
+    days_to_keep: Optional[int] = None,
+    num_to_keep: Optional[int] = None,
+    docker_registry: Optional[str] = None,
+    dry_run: bool = False,
+    max_workers: int = MAX_CLEANUP_WORKERS,
+    s3_client=None,
+    ecr_client=None,
+) -> int:
+    """Cleanup images of release labels and organizations concurrently, according to a cleanup policy
+    (days/number of images to keep).
+    :param organizations: Names or glob patterns of the organizations
+    :param release_labels: Release labels or glob patterns of release labels to target.
+    :param apt_repo: S3 bucket where release labels are published.
+    :param days_to_keep: (Optional) Age in days at which old images should be cleaned up.
+    :param num_to_keep: (Optional) Quantity of old images to keep, per image name. Not applied to docker images.
+    :param docker_registry: (Optional) URL of the ECR registry whose untagged images older than days_to_keep are
+                            cleaned up. Docker images are neither versioned per release label nor per organization,
+                            so the repository is cleaned up once.
+    :param max_workers: Size of the pool shared by listings, deletions and index updates.
+    :return: 0 if the cleanup succeeded, 1 otherwise
+    """
+    s3_client = s3_client or boto3.client("s3")
+    if docker_registry is not None:
+        ecr_client = ecr_client or boto3.client("ecr")
+        ecr_repository = docker_registry.replace("https://", "").split("/")[1]
+
+    if days_to_keep is not None:
+        date_to_keep: Optional[datetime] = datetime.now() - timedelta(days=days_to_keep)
+    else:
+        date_to_keep = None
+
+    if any(is_pattern(release_label) for release_label in release_labels):
+        patterns = release_labels
+        available_release_labels = list_s3_release_labels(s3_client, apt_repo)
+        release_labels = sorted(
+            release_label
+            for release_label in available_release_labels
+            if any(fnmatch(release_label, pattern) for pattern in patterns)
+        )
+        for pattern in patterns:
+            if not any(fnmatch(release_label, pattern) for release_label in available_release_labels):
+                click.echo(f"No release label in {apt_repo} matches {pattern}", err=True)
+
+    summaries: Dict[str, CleanupSummary] = {}
+    tasks: Dict[str, List[Future]] = defaultdict(list)
+    # Size of the objects deleted by each deletion task, by S3 key or ECR digest
+    deletion_sizes: Dict[Future, Dict[str, int]] = {}
+    matched_organizations: Set[str] = set()
+    failed = False
+
+    start_time = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # List the images of all release labels at once, organizations are filtered afterwards
+        listings = {
+            executor.submit(_timed, list_s3_image_sizes, s3_client, apt_repo, f"{release_label}/images/"): release_label
+            for release_label in release_labels
+        }
+        if docker_registry is not None:
+            ecr_listing = executor.submit(_timed, list_ecr_images, ecr_client, ecr_repository)
+
+        for listing in as_completed(listings):
+            release_label = listings[listing]
+            prefix = f"{release_label}/images"
+            try:
+                image_sizes, started_at, finished_at = listing.result()
+            except Exception as error:  # pylint: disable=broad-except
+                click.echo(f"Unable to list images in {apt_repo}/{prefix}: {error}", err=True)
+                failed = True
+                continue
+
+            # Don't create an index for prefixes that don't hold images
+            if not image_sizes:
+                click.echo(f"No images found in {apt_repo}/{prefix}, skipping")
+                continue
+
+            summary = summaries[release_label] = CleanupSummary(release_label, started_at, finished_at)
+
+            images = []
+            for image in image_sizes:
+                organization = image.name.split("_")[0]
+                matches = [pattern for pattern in organizations if fnmatch(organization, pattern)]
+                if matches:
+                    matched_organizations.update(matches)
+                    images.append(image)
+            to_delete = build_deletion_list(images, num_to_keep, date_to_keep)
+
+            if not dry_run:
+                for image in to_delete:
+                    key = f"{prefix}/{image}"
+                    future = executor.submit(_timed, delete_s3_image, s3_client, apt_repo, key)
+                    deletion_sizes[future] = {key: image_sizes[image]}
+                    tasks[release_label].append(future)
+            else:
+                click.echo(f"[DRY RUN] Would delete images from {prefix}:")
+                for image in to_delete:
+                    click.echo(image)
+                summary.objects = len(to_delete)
+                summary.size = sum(image_sizes[image] for image in to_delete)
+
+            # Images of organizations not being cleaned up are kept in the index too
+            keep_images = set(image_sizes) - to_delete
+            tasks[release_label].append(
+                executor.submit(_timed, update_index, s3_client, apt_repo, release_label, keep_images, dry_run)
+            )
+
+        if docker_registry is not None:
+            try:
+                remote_images, started_at, finished_at = ecr_listing.result()
+            except Exception as error:  # pylint: disable=broad-except
+                click.echo(f"Unable to list images in {ecr_repository}: {error}", err=True)
+                failed = True
+            else:
+                name = f"{ecr_repository} (ECR)"
+                summary = summaries[name] = CleanupSummary(name, started_at, finished_at)
+                to_delete_ecr = plan_ecr_cleanup(remote_images, ecr_repository, date_to_keep, dry_run)
+
+                if not dry_run:
+                    for i in range(0, len(to_delete_ecr), ECR_BATCH_SIZE):
+                        chunk = {
+                            image["imageDigest"]: image.get("imageSizeInBytes", 0)
+                            for image in to_delete_ecr[i:i + ECR_BATCH_SIZE]
+                        }
+                        future = executor.submit(_timed, delete_ecr_images, ecr_client, list(chunk), ecr_repository)
+                        deletion_sizes[future] = chunk
+                        tasks[name].append(future)
+                else:
+                    summary.objects = len(to_delete_ecr)
+                    summary.size = sum(image.get("imageSizeInBytes", 0) for image in to_delete_ecr)
+
+    for pattern in organizations:
+        if pattern not in matched_organizations:
+            click.echo(f"No images of organization {pattern} found", err=True)
+
+    for name, futures in tasks.items():
+        summary = summaries[name]
+        for future in futures:
+            try:
+                result, _, finished_at = future.result()
+            except Exception as error:  # pylint: disable=broad-except
+                click.echo(f"Cleanup of {name} failed: {error}", err=True)
+                failed = True
+                continue
+            summary.finished_at = max(summary.finished_at, finished_at)
+
+            if future in deletion_sizes:
+                sizes = deletion_sizes[future]
+                # ECR deletions return the digests actually deleted, S3 deletions raise on failure
+                deleted = sizes if result is None else result
+                if len(deleted) < len(sizes):
+                    click.echo(f"Cleanup of {name} failed: {len(sizes) - len(deleted)} images not deleted", err=True)
+                    failed = True
+                summary.objects += len(deleted)
+                summary.size += sum(sizes[item] for item in deleted)
+
+    click.echo("[DRY RUN] Cleanup summary (would be freed):" if dry_run else "Cleanup summary:")
+    for summary in summaries.values():
+        click.echo(
+            f"  {summary.name}: {summary.objects} objects, {format_size(summary.size)} in {summary.seconds:.1f}s"
+        )
+    click.echo(
+        f"  total: {sum(summary.objects for summary in summaries.values())} objects, "
+        f"{format_size(sum(summary.size for summary in summaries.values()))} "
+        f"in {time.monotonic() - start_time:.1f}s"
+    )
+
+    return 1 if failed else 0
 
 
 def main():
-    parser = argparse.ArgumentParser(description=cleanup_images.__doc__)
-    parser.add_argument("--release-label", type=str, required=True)
+    parser = argparse.ArgumentParser(description=cleanup_releases.__doc__)
+    parser.add_argument("--release-label", type=str, nargs="+", required=True)
     parser.add_argument("--apt-repo", type=str, required=True)
-    parser.add_argument("--organization", type=str, required=True)
+    parser.add_argument("--organization", type=str, nargs="+", required=True)
     parser.add_argument("--days-to-keep", type=int)
-    parser.add_argument("--num-to-keep", type=int)
+    parser.add_argument("--num-to-keep", type=int, help="Versions to keep per image name, not applied to docker images")
+    parser.add_argument(
+        "--docker-registry", type=str, help="ECR registry whose untagged images older than --days-to-keep are deleted"
+    )
     parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--max-workers", type=int, default=MAX_CLEANUP_WORKERS)
 
-    args = parser.parse_args()
+    args = vars(parser.parse_args())
+    release_labels = args.pop("release_label")
+    organizations = args.pop("organization")
 
-    sys.exit(cleanup_images(**vars(args)))
+    sys.exit(cleanup_releases(organizations, release_labels, **args))
 
 
 if __name__ == "__main__":
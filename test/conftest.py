@@ -0,0 +1,121 @@
+import io
+import json
+
+from typing import Any, Dict
+
+import botocore.exceptions
+import pytest
+
+
+OBJECTS = {
+    "hotdog/images/index": 10,
+    "hotdog/images/ubuntu-22.04-server-cloudimg-amd64-disk1.img": 100,
+    "hotdog/images/locus_bot_jammy_hotdog_20240101.000000.img": 2048,
+    "hotdog/images/locus_bot_jammy_hotdog_20240201.000000.img": 4096,
+    "hotdog/images/other_bot_jammy_hotdog_20231201.000000.img": 512,
+    "hotsauce/images/locus_bot_jammy_hotsauce_20240101.000000.img": 1024,
+    "hotsauce/images/locus_bot_jammy_hotsauce_20240301.000000.img": 1024,
+    "pool/main/p/package.deb": 1,
+}
+
+INDEXES: Dict[str, Dict[str, Any]] = {
+    "hotdog/images/index": {"20240101.000000": {}, "20240201.000000": {}, "20231201.000000": {}},
+    "hotsauce/images/index": {"20240101.000000": {}, "20240301.000000": {}},
+}
+
+
+class StubPaginator:
+    def __init__(self, paginate):
+        self.paginate = paginate
+
+
+class StubS3:
+    """Stand-in for a boto3 S3 client holding image objects and index files."""
+
+    def __init__(self, objects, indexes):
+        self.objects = dict(objects)
+        self.indexes = {key: dict(index) for key, index in indexes.items()}
+        self.fail_keys = set()
+        self.tags = {}
+        self.deleted = []
+        self.written = []
+
+    def get_paginator(self, name):
+        return StubPaginator(getattr(self, f"_paginate_{name}"))
+
+    def _paginate_list_objects_v2(self, Bucket, Prefix="", Delimiter=None):
+        if Delimiter:
+            prefixes = sorted({key.split(Delimiter)[0] + Delimiter for key in self.objects})
+            return [{"CommonPrefixes": [{"Prefix": prefix} for prefix in prefixes]}]
+        contents = [{"Key": key, "Size": size} for key, size in self.objects.items() if key.startswith(Prefix)]
+        # One object per page to exercise pagination
+        return [{"Contents": [content]} for content in contents] or [{}]
+
+    def _paginate_list_object_versions(self, Bucket, Prefix):
+        return [{}]
+
+    def delete_object(self, Bucket, Key, VersionId=None):
+        if Key in self.fail_keys:
+            raise botocore.exceptions.ClientError({"Error": {"Code": "AccessDenied"}}, "DeleteObject")
+        self.deleted.append(Key)
+
+    def get_object_tagging(self, Bucket, Key):
+        if Key not in self.indexes:
+            raise botocore.exceptions.ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObjectTagging")
+        return {"TagSet": self.tags.get(Key, [])}
+
+    def put_object_tagging(self, Bucket, Key, Tagging):
+        self.tags[Key] = Tagging["TagSet"]
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(json.dumps(self.indexes[Key]).encode())}
+
+    def put_object(self, Bucket, Key, Body, Tagging=None):
+        self.indexes[Key] = json.loads(Body)
+        self.written.append(Key)
+
+
+class StubECR:
+    """Stand-in for a boto3 ECR client, images are described one page per list in pages."""
+
+    def __init__(self):
+        self.pages = []
+        self.manifests = {}
+        self.fail_digests = set()
+        self.listings = []
+        self.deleted = []
+
+    def get_paginator(self, name):
+        return StubPaginator(getattr(self, f"_paginate_{name}"))
+
+    def _paginate_describe_images(self, **kwargs):
+        self.listings.append(kwargs)
+        return [{"imageDetails": page} for page in self.pages]
+
+    def batch_get_image(self, repositoryName, imageIds, acceptedMediaTypes):
+        return {
+            "images": [
+                {"imageId": image_id, "imageManifest": json.dumps(self.manifests[image_id["imageDigest"]])}
+                for image_id in imageIds
+            ]
+        }
+
+    def batch_delete_image(self, repositoryName, imageIds):
+        self.deleted.append(imageIds)
+        return {
+            "imageIds": [image_id for image_id in imageIds if image_id["imageDigest"] not in self.fail_digests],
+            "failures": [
+                {"imageId": image_id, "failureCode": "ImageNotFound", "failureReason": "not found"}
+                for image_id in imageIds if image_id["imageDigest"] in self.fail_digests
+            ],
+        }
+
+
+@pytest.fixture
+def s3_client():
+    return StubS3(OBJECTS, INDEXES)
+
+
+@pytest.fixture
+def ecr_client():
+    return StubECR()
@@ -0,0 +1,180 @@
+import sys
+
+from datetime import datetime
+
+import pytest
+
+from tailor_image import cleanup_images
+
+
+REGISTRY = "https://123456789012.dkr.ecr.us-east-1.amazonaws.com/tailor"
+
+
+def run_main(monkeypatch, s3_client, argv):
+    monkeypatch.setattr(cleanup_images.boto3, "client", lambda service: s3_client)
+    monkeypatch.setattr(sys, "argv", ["cleanup_images", "--apt-repo", "bucket"] + argv)
+
+    with pytest.raises(SystemExit) as exit_info:
+        cleanup_images.main()
+
+    return exit_info.value.code
+
+
+def test_main_single_release_label(monkeypatch, s3_client, capsys):
+    result = run_main(
+        monkeypatch, s3_client, ["--release-label", "hotdog", "--organization", "locus", "--num-to-keep", "1"]
+    )
+
+    assert result == 0
+    assert s3_client.deleted == ["hotdog/images/locus_bot_jammy_hotdog_20240101.000000.img"]
+    # Versions of other organizations are kept in the index
+    assert s3_client.indexes["hotdog/images/index"] == {"20240201.000000": {}, "20231201.000000": {}}
+    assert "  hotdog: 1 objects, 2.0 KiB in " in capsys.readouterr().out
+
+
+def test_main_single_release_label_matches_whole_organization(monkeypatch, s3_client):
+    result = run_main(
+        monkeypatch, s3_client, ["--release-label", "hotdog", "--organization", "loc", "--num-to-keep", "1"]
+    )
+
+    assert result == 0
+    assert s3_client.deleted == []
+
+
+def test_main_single_release_label_fails_on_deletion_error(monkeypatch, s3_client):
+    s3_client.fail_keys.add("hotdog/images/locus_bot_jammy_hotdog_20240101.000000.img")
+
+    result = run_main(
+        monkeypatch, s3_client, ["--release-label", "hotdog", "--organization", "locus", "--num-to-keep", "1"]
+    )
+
+    assert result == 1
+
+
+def test_cleanup_releases_expands_patterns(s3_client, capsys):
+    result = cleanup_images.cleanup_releases(
+        ["locus"], ["hot*", "taco*"], "bucket", num_to_keep=1, s3_client=s3_client
+    )
+
+    assert result == 0
+    assert sorted(s3_client.deleted) == [
+        "hotdog/images/locus_bot_jammy_hotdog_20240101.000000.img",
+        "hotsauce/images/locus_bot_jammy_hotsauce_20240101.000000.img",
+    ]
+    assert "No release label in bucket matches taco*" in capsys.readouterr().err
+
+
+def test_cleanup_releases_filters_organizations_and_keeps_their_index(s3_client):
+    cleanup_images.cleanup_releases(["loc*"], ["hotdog"], "bucket", days_to_keep=0, s3_client=s3_client)
+
+    assert sorted(s3_client.deleted) == [
+        "hotdog/images/locus_bot_jammy_hotdog_20240101.000000.img",
+        "hotdog/images/locus_bot_jammy_hotdog_20240201.000000.img",
+    ]
+    assert s3_client.indexes["hotdog/images/index"] == {"20231201.000000": {}}
+
+
+def test_cleanup_releases_skips_release_labels_without_images(s3_client, capsys):
+    cleanup_images.cleanup_releases(["locus"], ["*"], "bucket", num_to_keep=1, s3_client=s3_client)
+
+    assert sorted(s3_client.written) == ["hotdog/images/index", "hotsauce/images/index"]
+    assert "pool/images/index" not in s3_client.indexes
+    assert "pool/images/index" not in s3_client.tags
+    assert "No images found in bucket/pool/images, skipping" in capsys.readouterr().out
+
+
+def test_cleanup_releases_summary(s3_client, capsys):
+    cleanup_images.cleanup_releases(
+        ["locus", "other"], ["hotdog", "hotsauce"], "bucket", num_to_keep=1, s3_client=s3_client
+    )
+
+    output = capsys.readouterr().out
+    assert "  hotdog: 1 objects, 2.0 KiB in " in output
+    assert "  hotsauce: 1 objects, 1.0 KiB in " in output
+    assert "  total: 2 objects, 3.0 KiB in " in output
+
+
+def test_cleanup_releases_dry_run(s3_client, capsys):
+    cleanup_images.cleanup_releases(
+        ["locus"], ["hotdog"], "bucket", num_to_keep=1, dry_run=True, s3_client=s3_client
+    )
+
+    output = capsys.readouterr().out
+    assert s3_client.deleted == []
+    assert s3_client.written == []
+    assert "[DRY RUN] Would delete images from hotdog/images:\nlocus_bot_jammy_hotdog_20240101.000000.img\n" in output
+    assert "  hotdog: 1 objects, 2.0 KiB in " in output
+
+
+def test_cleanup_releases_fails_on_deletion_error(s3_client, capsys):
+    s3_client.fail_keys.add("hotdog/images/locus_bot_jammy_hotdog_20240101.000000.img")
+
+    result = cleanup_images.cleanup_releases(["locus"], ["hot*"], "bucket", num_to_keep=1, s3_client=s3_client)
+
+    captured = capsys.readouterr()
+    assert result == 1
+    assert "Cleanup of hotdog failed" in captured.err
+    assert "  hotdog: 0 objects, 0 B in " in captured.out
+    assert "  hotsauce: 1 objects, 1.0 KiB in " in captured.out
+
+
+def test_cleanup_releases_lists_ecr_once(s3_client, ecr_client, capsys):
+    ecr_client.pages = [[
+        {"imageDigest": "sha256:old", "imagePushedAt": datetime(2024, 1, 1), "imageSizeInBytes": 1024},
+        {"imageDigest": "sha256:new", "imagePushedAt": datetime.now(), "imageSizeInBytes": 1024},
+        {"imageDigest": "sha256:live", "imagePushedAt": datetime(2024, 3, 1), "imageTags": ["tailor-image-bot"]},
+    ]]
+
+    result = cleanup_images.cleanup_releases(
+        ["locus"], ["hotdog", "hotsauce"], "bucket", days_to_keep=30, docker_registry=REGISTRY,
+        s3_client=s3_client, ecr_client=ecr_client,
+    )
+
+    assert result == 0
+    assert len(ecr_client.listings) == 1
+    assert ecr_client.deleted == [[{"imageDigest": "sha256:old"}]]
+    assert "  tailor (ECR): 1 objects, 1.0 KiB in " in capsys.readouterr().out
+
+
+def test_cleanup_releases_ecr_dry_run(s3_client, ecr_client, capsys):
+    ecr_client.pages = [[{"imageDigest": "sha256:old", "imagePushedAt": datetime(2024, 1, 1)}]]
+
+    cleanup_images.cleanup_releases(
+        ["locus"], ["hotdog"], "bucket", days_to_keep=30, docker_registry=REGISTRY, dry_run=True,
+        s3_client=s3_client, ecr_client=ecr_client,
+    )
+
+    assert ecr_client.deleted == []
+    assert "[DRY RUN] Would delete images from tailor:\ntailor@sha256:old\n" in capsys.readouterr().out
+
+
+def test_cleanup_releases_fails_on_partial_ecr_failure(s3_client, ecr_client, capsys):
+    ecr_client.pages = [[
+        {"imageDigest": "sha256:a", "imagePushedAt": datetime(2024, 1, 1), "imageSizeInBytes": 1024},
+        {"imageDigest": "sha256:b", "imagePushedAt": datetime(2024, 1, 2), "imageSizeInBytes": 1024},
+    ]]
+    ecr_client.fail_digests = {"sha256:b"}
+
+    result = cleanup_images.cleanup_releases(
+        ["locus"], ["hotdog"], "bucket", days_to_keep=30, docker_registry=REGISTRY,
+        s3_client=s3_client, ecr_client=ecr_client,
+    )
+
+    captured = capsys.readouterr()
+    assert result == 1
+    assert "Cleanup of tailor (ECR) failed: 1 images not deleted" in captured.err
+    assert "  tailor (ECR): 1 objects, 1.0 KiB in " in captured.out
+
+
+def test_cleanup_releases_does_not_apply_num_to_keep_to_ecr(s3_client, ecr_client):
+    ecr_client.pages = [[
+        {"imageDigest": "sha256:a", "imagePushedAt": datetime(2024, 1, 1)},
+        {"imageDigest": "sha256:b", "imagePushedAt": datetime(2024, 1, 2)},
+    ]]
+
+    cleanup_images.cleanup_releases(
+        ["locus"], ["hotdog"], "bucket", num_to_keep=1, docker_registry=REGISTRY,
+        s3_client=s3_client, ecr_client=ecr_client,
+    )
+
+    assert ecr_client.deleted == []
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+from tailor_image import ImageEntry, delete_ecr_images, list_ecr_images
+from tailor_image.cleanup_images import plan_ecr_cleanup
+
+
+INDEX_MEDIA_TYPE = "application/vnd.oci.image.index.v1+json"
+
+
+def image(digest, pushed_at, tags=None, media_type="application/vnd.docker.distribution.manifest.v2+json"):
+    details = {"imageDigest": digest, "imagePushedAt": pushed_at, "imageManifestMediaType": media_type}
+    if tags:
+        details["imageTags"] = tags
+    return details
+
+
+def test_list_ecr_images_paginates_untagged_images(ecr_client):
+    ecr_client.pages = [
+        [image("sha256:live", datetime(2024, 3, 1), ["tailor-image-bot-jammy-hotdog"]),
+         image("sha256:old", datetime(2024, 1, 1))],
+        [image("sha256:older", datetime(2023, 12, 1, 10, 30))],
+    ]
+
+    images = list_ecr_images(ecr_client, "tailor")
+
+    assert ecr_client.listings == [{"repositoryName": "tailor"}]
+    assert images == {
+        ImageEntry("tailor", "20240101.000000", "docker"): [image("sha256:old", datetime(2024, 1, 1))],
+        ImageEntry("tailor", "20231201.103000", "docker"): [image("sha256:older", datetime(2023, 12, 1, 10, 30))],
+    }
+
+
+def test_list_ecr_images_keeps_manifest_list_children(ecr_client):
+    ecr_client.pages = [[
+        image("sha256:index", datetime(2024, 3, 1), ["tailor-image-bot-jammy-hotdog"], INDEX_MEDIA_TYPE),
+        image("sha256:child", datetime(2024, 3, 1)),
+        image("sha256:stale", datetime(2024, 1, 1)),
+    ]]
+    ecr_client.manifests = {"sha256:index": {"manifests": [{"digest": "sha256:child"}]}}
+
+    images = list_ecr_images(ecr_client, "tailor")
+
+    digests = [details["imageDigest"] for entry in images.values() for details in entry]
+    assert digests == ["sha256:stale"]
+
+
+def test_delete_ecr_images_in_chunks(ecr_client, capsys):
+    ecr_client.fail_digests = {"sha256:0"}
+
+    deleted = delete_ecr_images(ecr_client, [f"sha256:{i}" for i in range(250)], "tailor")
+
+    assert [len(chunk) for chunk in ecr_client.deleted] == [100, 100, 50]
+    assert ecr_client.deleted[2][-1] == {"imageDigest": "sha256:249"}
+    assert len(deleted) == 249 and "sha256:0" not in deleted
+    assert "Unable to delete tailor@sha256:0: not found" in capsys.readouterr().err
+
+
+def test_plan_ecr_cleanup_prunes_by_age_only(ecr_client):
+    ecr_client.pages = [[
+        image("sha256:a", datetime(2024, 1, 1)),
+        image("sha256:b", datetime(2024, 1, 2)),
+        image("sha256:c", datetime(2024, 6, 1)),
+    ]]
+    images = list_ecr_images(ecr_client, "tailor")
+
+    to_delete = plan_ecr_cleanup(images, "tailor", date_to_keep=datetime(2024, 3, 1))
+
+    assert [details["imageDigest"] for details in to_delete] == ["sha256:a", "sha256:b"]
+    assert plan_ecr_cleanup(images, "tailor") == []
+
+
+def test_plan_ecr_cleanup_dry_run(ecr_client, capsys):
+    ecr_client.pages = [[image("sha256:a", datetime(2024, 1, 1)), image("sha256:b", datetime(2024, 6, 1))]]
+    images = list_ecr_images(ecr_client, "tailor")
+
+    plan_ecr_cleanup(images, "tailor", date_to_keep=datetime(2024, 3, 1), dry_run=True)
+
+    assert capsys.readouterr().out == "[DRY RUN] Would delete images from tailor:\ntailor@sha256:a\n"